@@ -1,88 +1,291 @@
 # agent_logic.py
 
 import os
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
-from langchain_groq import ChatGroq
-from langchain.prompts import PromptTemplate
-from langchain.chains.summarize import load_summarize_chain
-from langchain.docstore.document import Document
-import telegram
+import json
+import codecs
+import functools
+import hashlib
+import html
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import httpx
+from selectolax.lexbor import LexborHTMLParser
+from pybloom_live import ScalableBloomFilter
+from datasketch import MinHash
+from lxml import etree
+from lxml.cssselect import CSSSelector
+from urllib.parse import urljoin, urlsplit
+from groq import AsyncGroq, GroqError
 import asyncio
 
+# --- 0. SHARED HTTP CLIENT ---
+# One pooled HTTP/2 client is created per agent and passed to every network
+# helper, so keep-alive connections (and their TLS handshakes) are reused and
+# same-host requests are multiplexed.
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
+
+_CLIENT_LOCK = threading.Lock()
+
+# Errors a single request can raise. A malformed URL (bad port, invalid IDNA
+# host, ...) raises httpx.InvalidURL or a ValueError, which aren't HTTPErrors;
+# either way it's one bad link, not a reason to stop the run.
+REQUEST_ERRORS = (httpx.HTTPError, httpx.InvalidURL, ValueError)
+
+def create_http_client(max_connections=100):
+    """
+    Builds the shared httpx.AsyncClient for an agent.
+
+    Its connections bind to the event loop it is first used on, so create one
+    per long-lived loop and pass it to get_latest_articles and run_pipeline.
+    """
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+            keepalive_expiry=30,
+        ),
+    )
+    return httpx.AsyncClient(
+        transport=transport,
+        timeout=15,
+        follow_redirects=True,
+        headers=HEADERS,
+    )
+
 # --- 1. CORE SCRAPING FUNCTIONS ---
 
-def get_latest_articles(site_url, link_selector):
+# Homepages list mostly the same links from one poll to the next, so resolved
+# URLs are memoized per (site_url, href).
+_absolute_url = functools.lru_cache(maxsize=4096)(urljoin)
+
+@functools.lru_cache(maxsize=None)
+def compile_selector(css):
     """
-    Fetches the latest article links from a news homepage, with better filtering.
+    Compiles a CSS selector for get_latest_articles.
+
+    app.py's cached site table already compiles each site once per process;
+    the memo only lets sites with the same selector (e.g. "h3 > a") share one
+    compiled XPath.
     """
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-    try:
-        # BUG FIX: Increased timeout for better reliability with international sites.
-        response = requests.get(site_url, headers=headers, timeout=15)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        articles = []
+    return CSSSelector(css)
+
+def _collect_articles(site_url, link_elements, limit):
+    """Turns matched headline links into up to `limit` {'title', 'url'} articles."""
+    articles = []
+    seen = set()
+    
+    for link_element in link_elements:
+        title = " ".join("".join(link_element.itertext()).split())
+        href = link_element.get('href')
         
-        for link_element in soup.select(link_selector):
-            title = link_element.get_text(strip=True)
-            href = link_element.get('href')
+        if title and href and len(title.split()) > 5:
+            # Dedup on the absolute URL so relative and absolute links collapse
+            try:
+                full_url = _absolute_url(site_url, href)
+            except ValueError:
+                # A malformed href (e.g. "http://[broken/story") is just skipped
+                continue
+            if full_url in seen:
+                continue
+            seen.add(full_url)
+            articles.append({'title': title, 'url': full_url})
+            if len(articles) == limit:
+                break
             
-            if title and href and len(title.split()) > 5:
-                if href not in [a['url'] for a in articles]:
-                    full_url = urljoin(site_url, href)
-                    articles.append({'title': title, 'url': full_url})
-                
-        return articles[:10]
-
-    except requests.RequestException as e:
+    return articles
+
+# Homepages are parsed as they download, checking for enough headlines after
+# each chunk, so the rest of a long page is never fetched.
+HOMEPAGE_CHUNK_BYTES = 64 * 1024
+
+# Last validators and parsed articles per homepage, for conditional GETs.
+_HOMEPAGE_CACHE = {}
+
+def _known_encoding(charset):
+    """Returns charset if Python has a codec for it, otherwise None so the parser sniffs the page."""
+    if not charset:
+        return None
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        return None
+    return charset
+
+async def get_latest_articles(client, site_url, link_selector, limit=10):
+    """
+    Fetches the latest article links from a news homepage, with better filtering.
+
+    Sends If-None-Match / If-Modified-Since from the previous fetch, so an
+    unchanged homepage costs a bodiless 304 and no parsing. Otherwise the page
+    is streamed into an incremental parser and the download is dropped as soon
+    as `limit` headlines are found.
+
+    Args:
+        client: The agent's shared httpx.AsyncClient (see create_http_client).
+        link_selector: A compiled selector for the headline links (see compile_selector).
+        limit: How many articles to return at most.
+    """
+    headers = {}
+    cached = _HOMEPAGE_CACHE.get(site_url)
+    if cached:
+        etag, last_modified, _ = cached
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+    try:
+        async with client.stream('GET', site_url, headers=headers) as response:
+            if response.status_code == 304 and cached:
+                return [dict(article) for article in cached[2]]
+            response.raise_for_status()
+
+            # Only the <html> start event is reported; it hands over the root of
+            # the partial tree so the selector can run mid-download.
+            parser = etree.HTMLPullParser(
+                events=('start',), tag='html', encoding=_known_encoding(response.charset_encoding)
+            )
+            root = None
+            async for chunk in response.aiter_bytes(HOMEPAGE_CHUNK_BYTES):
+                parser.feed(chunk)
+                for _, element in parser.read_events():
+                    root = element
+                if root is None:
+                    continue
+                # The last match may still be open at the parse frontier, so its
+                # title could be cut short; it's picked up on a later chunk.
+                articles = _collect_articles(site_url, link_selector(root)[:-1], limit)
+                if len(articles) == limit:
+                    break
+            else:
+                articles = _collect_articles(site_url, link_selector(parser.close()), limit)
+
+        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+        if etag or last_modified:
+            _HOMEPAGE_CACHE[site_url] = (etag, last_modified, [dict(article) for article in articles])
+        else:
+            _HOMEPAGE_CACHE.pop(site_url, None)
+        return articles
+
+    except REQUEST_ERRORS as e:
         print(f"Error fetching homepage {site_url}: {e}")
         return []
+    except (etree.LxmlError, LookupError) as e:
+        print(f"Error parsing homepage {site_url}: {e}")
+        return []
+
+# Article text sits near the top of the page, so giant photo galleries are
+# skipped outright and everything else is read only up to a cap.
+MAX_ARTICLE_BYTES = 2_000_000
+ARTICLE_READ_BYTES = 1_500_000
 
-def scrape_article_content(article_url):
+async def _fetch_article(client, article_url):
     """
-    Scrapes the main text and lead image from a single article page.
-    
+    Downloads a single article page, streaming at most ARTICLE_READ_BYTES.
+
     Returns:
-        A dictionary with 'text' and 'image_url'.
+        The raw HTML bytes, or None on a network error or an oversized page.
     """
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
     try:
-        response = requests.get(article_url, headers=headers, timeout=15)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        paragraphs = soup.find_all('p')
-        article_text = " ".join([p.get_text(strip=True) for p in paragraphs])
+        async with client.stream('GET', article_url) as response:
+            response.raise_for_status()
+            content_length = response.headers.get('Content-Length', '')
+            if content_length.isdigit() and int(content_length) > MAX_ARTICLE_BYTES:
+                print(f"Skipping oversized article {article_url} ({content_length} bytes)")
+                return None
 
-        image_url = None
-        og_image = soup.find('meta', property='og_image')
-        if og_image and og_image.get('content'):
-            image_url = og_image['content']
-        
-        if not article_text:
-            return None
-
-        return {'text': article_text, 'image_url': image_url}
-
-    except requests.RequestException as e:
+            chunks, size = [], 0
+            async for chunk in response.aiter_bytes():
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= ARTICLE_READ_BYTES:
+                    break
+            return b"".join(chunks)[:ARTICLE_READ_BYTES]
+    except REQUEST_ERRORS as e:
         print(f"Error scraping article {article_url}: {e}")
         return None
 
-# --- 2. SUMMARIZATION WITH LANGCHAIN + GROQ ---
-def summarize_article(groq_api_key, article_text, article_title):
+def _parse_article(html):
     """
-    Summarizes the article with crash handling and a stricter length prompt.
+    Extracts the main text and lead image from downloaded article HTML.
+
+    Uses selectolax's Lexbor backend, whose C-level CSS matching pulls out only
+    the <p> and og:image nodes without building a Python object for every
+    element in the page.
+
+    Returns:
+        A dictionary with 'text' and 'image_url', or None if there is no text.
     """
-    if not article_text: return "Summary could not be generated."
+    tree = LexborHTMLParser(html)
     
-    docs = [Document(page_content=article_text)]
-    llm = ChatGroq(model_name="llama3-70b-8192", groq_api_key=groq_api_key, temperature=0.5)
+    paragraphs = (p.text(strip=True) for p in tree.css('p'))
+    article_text = " ".join(text for text in paragraphs if text)
+
+    image_url = None
+    og_image = tree.css_first('meta[property="og:image"]')
+    if og_image and og_image.attributes.get('content'):
+        image_url = og_image.attributes['content']
     
-    prompt_template = """
+    if not article_text:
+        return None
+
+    return {'text': article_text, 'image_url': image_url}
+
+async def scrape_article_content(client, article_url):
+    """
+    Scrapes the main text and lead image from a single article page.
+    
+    Returns:
+        A dictionary with 'text' and 'image_url'.
+    """
+    html = await _fetch_article(client, article_url)
+    if html is None:
+        return None
+    return await asyncio.to_thread(_parse_article, html)
+
+# --- 2. SUMMARIZATION WITH GROQ ---
+GROQ_MODEL = "llama3-70b-8192"
+# Groq requests in flight at once per pipeline, kept under the account's rate limits
+LLM_CONCURRENCY = 10
+
+# Clients are built once and reused so their HTTP connections stay warm. Each
+# is used only from the agent's event loop.
+_LLMS = {}
+
+def _get_llm(groq_api_key):
+    """Returns the shared AsyncGroq client for this API key, creating it on first use."""
+    with _CLIENT_LOCK:
+        if groq_api_key not in _LLMS:
+            _LLMS[groq_api_key] = AsyncGroq(api_key=groq_api_key)
+        return _LLMS[groq_api_key]
+
+async def _complete(llm, semaphore, prompt, **kwargs):
+    """Sends one chat completion request, holding a semaphore slot, and returns the reply text."""
+    async with semaphore:
+        response = await llm.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.5,
+            **kwargs
+        )
+    return response.choices[0].message.content
+
+# News articles front-load their key facts, so the lead plus the closing
+# paragraphs (~2.5k tokens) is enough context for a 700-character summary.
+ARTICLE_HEAD_CHARS = 8000
+ARTICLE_TAIL_CHARS = 2000
+
+def _truncate_for_llm(article_text):
+    """Keeps the lead and the conclusion of long articles to cap prompt tokens."""
+    if len(article_text) <= ARTICLE_HEAD_CHARS + ARTICLE_TAIL_CHARS:
+        return article_text
+    return article_text[:ARTICLE_HEAD_CHARS] + " ... " + article_text[-ARTICLE_TAIL_CHARS:]
+
+SUMMARY_PROMPT_TEMPLATE = """
 You are a professional news summarizer for an international audience. 
 Your task is to condense the article titled "{article_title}" into a short, neutral, and highly-informative summary.
 
@@ -103,48 +306,672 @@ ARTICLE TEXT:
 
 SUMMARY:
 """
-    prompt = PromptTemplate(template=prompt_template, input_variables=["text", "article_title"])
+
+async def summarize_article(groq_api_key, article_text, article_title, semaphore):
+    """
+    Summarizes the article with crash handling and a stricter length prompt.
+
+    Args:
+        semaphore: Bounds the caller's Groq requests in flight (see LLM_CONCURRENCY).
+    """
+    if not article_text: return "Summary could not be generated."
     
-    chain = load_summarize_chain(llm, chain_type="stuff", prompt=prompt)
+    prompt = SUMMARY_PROMPT_TEMPLATE.format(
+        article_title=article_title, text=_truncate_for_llm(article_text)
+    )
     
     try:
-        summary = chain.invoke({"input_documents": docs, "article_title": article_title})
-        return summary['output_text']
-    except Exception as e:
+        return await _complete(_get_llm(groq_api_key), semaphore, prompt)
+    except GroqError as e:
         print(f"Error during summarization with Groq API: {e}")
         return None
 
+BATCH_PROMPT_TEMPLATE = """
+You are a professional news summarizer for an international audience. 
+Your task is to condense each of the {count} numbered articles below into a short, neutral, and highly-informative summary.
+
+INSTRUCTIONS (apply to every article independently):
+- Output only 2–3 bullet points per article.
+- Each bullet must present one key fact, decision, or development from the article.
+- Use clear, factual, journalistic language (avoid adjectives, opinions, or speculation).
+- Prioritize the following in order: 
+  1. Who/What happened, 
+  2. Where/When it happened, 
+  3. Why it matters (impact or consequence).
+- Each summary MUST be under 700 characters total.
+- At the very end of each summary, mention the source.
+
+OUTPUT FORMAT:
+Return ONLY a JSON object of the form {{"summaries": [...]}}, where "summaries" holds exactly {count} strings,
+one summary per article, in the same order as the articles.
+
+ARTICLES:
+{articles}
+"""
+
+# Rough per-request character budget (~4 chars per token) so a batch stays
+# well inside the model's 8k-token context, leaving room for the output.
+BATCH_CHAR_BUDGET = 20000
+
+def _make_batches(articles, batch_size):
+    """Groups articles into batches of at most batch_size items and BATCH_CHAR_BUDGET characters."""
+    batches, current, current_chars = [], [], 0
+    for article in articles:
+        size = len(article['text'])
+        if current and (len(current) >= batch_size or current_chars + size > BATCH_CHAR_BUDGET):
+            batches.append(current)
+            current, current_chars = [], 0
+        current.append(article)
+        current_chars += size
+    if current:
+        batches.append(current)
+    return batches
+
+def _parse_batch_response(response, count):
+    """
+    Extracts the list of summaries from a batched LLM reply.
+
+    Returns:
+        A list of `count` summary strings, or None if the reply is malformed.
+    """
+    if isinstance(response, Exception):
+        print(f"Error during batched summarization with Groq API: {response}")
+        return None
+    try:
+        payload = json.loads(response)
+    except (TypeError, json.JSONDecodeError):
+        return None
+    summaries = payload.get('summaries') if isinstance(payload, dict) else payload
+    if not isinstance(summaries, list) or len(summaries) != count:
+        return None
+    if not all(isinstance(summary, str) and summary.strip() for summary in summaries):
+        return None
+    return summaries
+
+async def summarize_articles(groq_api_key, articles, semaphore, batch_size=5):
+    """
+    Summarizes many articles with several articles per Groq request.
+
+    Batches are sent concurrently; a batch whose reply can't be parsed falls
+    back to one summarize_article call per article.
+
+    Args:
+        articles: A list of dictionaries with 'title' and 'text'.
+        semaphore: Bounds the caller's Groq requests in flight, shared across
+            calls (see LLM_CONCURRENCY).
+
+    Returns:
+        A list of summaries in the same order as `articles` (None where summarization failed).
+    """
+    if not articles:
+        return []
+
+    llm = _get_llm(groq_api_key)
+
+    articles = [{**article, 'text': _truncate_for_llm(article['text'])} for article in articles]
+    batches = _make_batches(articles, batch_size)
+    prompts = []
+    for batch in batches:
+        numbered = "\n\n".join(
+            f"[{i}] TITLE: {article['title']}\nTEXT: {article['text']}"
+            for i, article in enumerate(batch, start=1)
+        )
+        prompts.append(BATCH_PROMPT_TEMPLATE.format(count=len(batch), articles=numbered))
+
+    # JSON mode makes Groq guarantee a parseable object, so batches rarely fall
+    # back to one request per article.
+    responses = await asyncio.gather(
+        *[_complete(llm, semaphore, prompt, response_format={"type": "json_object"}) for prompt in prompts],
+        return_exceptions=True
+    )
+
+    async def summarize_batch(batch, response):
+        parsed = _parse_batch_response(response, len(batch))
+        if parsed is None:
+            parsed = await asyncio.gather(
+                *[summarize_article(groq_api_key, a['text'], a['title'], semaphore) for a in batch]
+            )
+        return parsed
+
+    summaries = []
+    for parsed in await asyncio.gather(*[summarize_batch(b, r) for b, r in zip(batches, responses)]):
+        summaries.extend(parsed)
+    return summaries
+
+# Summaries keyed by a hash of the article text, so syndicated copies of the
+# same story are only summarized once. Checked in a bounded in-memory LRU
+# first, then on disk.
+SUMMARY_MEMO_SIZE = 4096
+_SUMMARY_MEMO = OrderedDict()
+_SUMMARY_DBS = {}
+_SUMMARY_LOCK = threading.Lock()
+
+def _content_hash(article_text):
+    """Hashes whitespace-normalized text, so re-wrapped copies of a body share a key."""
+    normalized = " ".join(article_text.split())
+    return hashlib.blake2b(normalized.encode(), digest_size=16).hexdigest()
+
+def _remember_summary(key, summary):
+    """Stores a summary in the in-memory LRU, evicting the oldest entry when full."""
+    _SUMMARY_MEMO[key] = summary
+    _SUMMARY_MEMO.move_to_end(key)
+    if len(_SUMMARY_MEMO) > SUMMARY_MEMO_SIZE:
+        _SUMMARY_MEMO.popitem(last=False)
+
+def _use_wal(conn):
+    """
+    Puts a connection in WAL mode with synchronous=NORMAL.
+
+    Commits then append to the write-ahead log without an fsync each; the log
+    is synced at checkpoints, which is durable enough for caches and state.
+    """
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+def _summary_db(db_path):
+    """Returns the shared connection for db_path, creating the table on first use."""
+    if db_path not in _SUMMARY_DBS:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        _use_wal(conn)
+        conn.execute("CREATE TABLE IF NOT EXISTS summaries(hash TEXT PRIMARY KEY, summary_text TEXT)")
+        _SUMMARY_DBS[db_path] = conn
+    return _SUMMARY_DBS[db_path]
+
+def get_cached_summary(article_text, db_path="summary_cache.sqlite"):
+    """
+    Looks up a previously generated summary for identical article text (ignoring whitespace).
+
+    Returns:
+        The cached summary string, or None on a miss.
+    """
+    key = _content_hash(article_text)
+    with _SUMMARY_LOCK:
+        if key in _SUMMARY_MEMO:
+            _SUMMARY_MEMO.move_to_end(key)
+            return _SUMMARY_MEMO[key]
+        row = _summary_db(db_path).execute(
+            "SELECT summary_text FROM summaries WHERE hash = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        _remember_summary(key, row[0])
+        return row[0]
+
+def cache_summary(article_text, summary, db_path="summary_cache.sqlite"):
+    key = _content_hash(article_text)
+    with _SUMMARY_LOCK:
+        _remember_summary(key, summary)
+        conn = _summary_db(db_path)
+        conn.execute("INSERT OR REPLACE INTO summaries(hash, summary_text) VALUES (?, ?)", (key, summary))
+        conn.commit()
+
 # --- 3. TELEGRAM POSTER & STATE MANAGEMENT ---
-async def post_to_telegram(bot_token, channel_id, summary, article):
+TELEGRAM_API_URL = "https://api.telegram.org/bot{token}/{method}"
+
+# sendPhoto errors meaning Telegram couldn't fetch the image URL itself; the
+# image is then downloaded here and uploaded instead.
+PHOTO_URL_ERRORS = ("wrong file identifier/http url", "failed to get http url content")
+# Telegram's size limit for uploaded photos
+MAX_PHOTO_BYTES = 10_000_000
+
+async def _call_telegram(client, bot_token, method, **request_kwargs):
     """
-    Formats and sends the message, truncating the summary if it's too long for a caption.
+    Calls a Bot API method over the shared HTTP client.
+
+    Returns:
+        The decoded API response, or None on a network or decoding error.
+    """
+    try:
+        response = await client.post(TELEGRAM_API_URL.format(token=bot_token, method=method), **request_kwargs)
+        return response.json()
+    except REQUEST_ERRORS as e:
+        print(f"Failed to post to Telegram: {e}")
+        return None
+
+async def _download_photo(client, image_url):
+    """
+    Downloads an image for a multipart upload, streaming at most MAX_PHOTO_BYTES.
+
+    Returns:
+        The image bytes, or None on a network error or an oversized image.
+    """
+    try:
+        async with client.stream('GET', image_url) as response:
+            response.raise_for_status()
+            content_length = response.headers.get('Content-Length', '')
+            if content_length.isdigit() and int(content_length) > MAX_PHOTO_BYTES:
+                return None
+
+            chunks, size = [], 0
+            async for chunk in response.aiter_bytes():
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > MAX_PHOTO_BYTES:
+                    # A truncated image is useless, so give up rather than cap it
+                    return None
+            return b"".join(chunks)
+    except REQUEST_ERRORS as e:
+        print(f"Error downloading image {image_url}: {e}")
+        return None
+
+# Longest summary put in a caption, leaving room for the title and link
+# within Telegram's 1024-character caption limit
+MAX_SUMMARY_LENGTH = 850
+
+@functools.lru_cache(maxsize=SUMMARY_MEMO_SIZE)
+def _summary_html(summary):
+    """
+    Truncates a summary for a caption and escapes it for Telegram's HTML mode.
+
+    Memoized alongside the summary cache, so a summary reposted or retried
+    isn't re-escaped.
     """
-    bot = telegram.Bot(token=bot_token)
-    
-    MAX_SUMMARY_LENGTH = 850
-    
     if len(summary) > MAX_SUMMARY_LENGTH:
         summary = summary[:MAX_SUMMARY_LENGTH] + "..."
+    return html.escape(summary, quote=False)
 
-    message = f"📰 *{article['title']}*\n\n{summary}\n\n🔗 [Read the full article here]({article['url']})"
+async def post_to_telegram(client, bot_token, channel_id, summary, article):
+    """
+    Formats and sends the message, truncating the summary if it's too long for a caption.
 
-    try:
-        if article.get('image_url'):
-            await bot.send_photo(chat_id=channel_id, photo=article['image_url'], caption=message, parse_mode='Markdown')
-        else:
-            await bot.send_message(chat_id=channel_id, text=message, parse_mode='Markdown')
-            
-        print(f"Successfully posted '{article['title']}' to Telegram.")
-        return True
-    except Exception as e:
-        print(f"Failed to post to Telegram: {e}")
+    Calls the Bot API directly over the agent's shared HTTP client, so posts reuse
+    its pooled connection to api.telegram.org. Images are sent by URL for Telegram
+    to fetch server-side; only when it can't is the image uploaded from here, and
+    failing that the article is posted as text.
+    """
+    # HTML mode only needs <, > and & escaped, unlike Markdown, which breaks
+    # on any stray * or _ in a title or summary
+    message = (
+        f"📰 <b>{html.escape(article['title'], quote=False)}</b>\n\n{_summary_html(summary)}\n\n"
+        f"🔗 <a href=\"{html.escape(article['url'])}\">Read the full article here</a>"
+    )
+
+    result = None
+    if article.get('image_url'):
+        payload = {'chat_id': channel_id, 'caption': message, 'parse_mode': 'HTML'}
+        result = await _call_telegram(
+            client, bot_token, "sendPhoto", json={**payload, 'photo': article['image_url']}
+        )
+        description = (result or {}).get('description', '').lower()
+        if result and not result.get('ok') and any(error in description for error in PHOTO_URL_ERRORS):
+            photo = await _download_photo(client, article['image_url'])
+            if photo:
+                result = await _call_telegram(
+                    client, bot_token, "sendPhoto", data=payload, files={'photo': ('photo.jpg', photo)}
+                )
+
+        if result is None:
+            # A network error may have hidden a delivered post, so don't resend it
+            return False
+        if not result.get('ok') and result.get('error_code') == 400:
+            # Telegram rejected the photo itself; post the article without it
+            print(f"Failed to post photo to Telegram: {result.get('description')}")
+            result = None
+
+    if result is None:
+        result = await _call_telegram(
+            client, bot_token, "sendMessage",
+            json={'chat_id': channel_id, 'text': message, 'parse_mode': 'HTML'}
+        )
+        if result is None:
+            return False
+
+    if not result.get('ok'):
+        print(f"Failed to post to Telegram: {result.get('description')}")
         return False
 
-def has_been_posted(article_url, file_path="posted_articles.txt"):
-    if not os.path.exists(file_path): return False
-    with open(file_path, 'r') as f:
-        return article_url in f.read().splitlines()
+    print(f"Successfully posted '{article['title']}' to Telegram.")
+    return True
+
+# Posted URLs live in SQLite (url is the primary key, so lookups are indexed
+# and inserts are atomic). A Bloom filter per database sits in front of the
+# table: URLs it has never seen are answered from memory, and only possible
+# matches are confirmed with a query. Unlike a set of every URL ever posted,
+# its memory stays small as the history grows.
+LEGACY_POSTED_FILE = "posted_articles.txt"
+_POSTED_DBS = {}
+_POSTED_FILTERS = {}
+_POSTED_LOCK = threading.Lock()
 
-def mark_as_posted(article_url, file_path="posted_articles.txt"):
-    with open(file_path, 'a') as f:
-        f.write(f"{article_url}\n")
+def _posted_db(db_path):
+    """
+    Returns the shared connection for db_path, creating the table on first use.
+
+    URLs from the old posted_articles.txt state file are imported so that
+    switching storage doesn't repost everything.
+    """
+    if db_path not in _POSTED_DBS:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+        _use_wal(conn)
+        conn.execute("CREATE TABLE IF NOT EXISTS posted(url TEXT PRIMARY KEY, ts INTEGER)")
+        if os.path.exists(LEGACY_POSTED_FILE):
+            with open(LEGACY_POSTED_FILE, 'r') as f:
+                now = int(time.time())
+                conn.executemany(
+                    "INSERT OR IGNORE INTO posted(url, ts) VALUES (?, ?)",
+                    [(url, now) for url in f.read().splitlines() if url]
+                )
+        conn.commit()
+        _POSTED_DBS[db_path] = conn
+    return _POSTED_DBS[db_path]
+
+def _posted_filter(db_path):
+    """Returns the Bloom filter for db_path, seeding it from the table on first use."""
+    if db_path not in _POSTED_FILTERS:
+        bloom = ScalableBloomFilter(initial_capacity=100_000, error_rate=1e-6)
+        for (url,) in _posted_db(db_path).execute("SELECT url FROM posted"):
+            bloom.add(url)
+        _POSTED_FILTERS[db_path] = bloom
+    return _POSTED_FILTERS[db_path]
+
+def has_been_posted(article_url, db_path="posted.db"):
+    with _POSTED_LOCK:
+        if article_url not in _posted_filter(db_path):
+            return False
+        row = _posted_db(db_path).execute("SELECT 1 FROM posted WHERE url = ?", (article_url,)).fetchone()
+        return row is not None
+
+def filter_unposted(urls, db_path="posted.db"):
+    """
+    Checks a batch of URLs against the posted store in one query.
+
+    Returns:
+        The set of URLs from `urls` that have not been posted yet.
+    """
+    urls = set(urls)
+    with _POSTED_LOCK:
+        bloom = _posted_filter(db_path)
+        candidates = [url for url in urls if url in bloom]
+        if not candidates:
+            return urls
+        placeholders = ",".join("?" * len(candidates))
+        rows = _posted_db(db_path).execute(
+            f"SELECT url FROM posted WHERE url IN ({placeholders})", candidates
+        )
+        return urls - {url for (url,) in rows}
+
+def mark_as_posted(article_url, db_path="posted.db"):
+    mark_many_as_posted([article_url], db_path)
+
+def mark_many_as_posted(urls, db_path="posted.db"):
+    """Records a batch of posted URLs in a single transaction."""
+    now = int(time.time())
+    with _POSTED_LOCK:
+        conn = _posted_db(db_path)
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO posted(url, ts) VALUES (?, ?)", [(url, now) for url in urls])
+        bloom = _posted_filter(db_path)
+        for url in urls:
+            bloom.add(url)
+
+# Near-duplicate stories (the same wire copy on several outlets) are caught by
+# LSH over MinHash signatures of 5-word shingles: 16 bands of 8 rows, so texts
+# with roughly 70%+ Jaccard similarity share at least one identical band. Each
+# band's keys go into its own Bloom filter (LSHBloom) to keep memory small.
+# Keys are stored both bare and prefixed with the outlet's host, so a match can
+# be limited to copies from a *different* outlet: an outlet's own boilerplate
+# (newsletter blurbs, footers, paywall notes) must not make its short stories
+# look like repeats of each other.
+STORY_BANDS = 16
+STORY_ROWS = 8
+STORY_SHINGLE_WORDS = 5
+# Texts with fewer shingles than this are too short to compare reliably
+MIN_STORY_SHINGLES = 50
+# A false hit in any of the 16 filters drops a new story for good, so each
+# filter's error rate is kept far below what a single lookup would need.
+STORY_FILTER_ERROR_RATE = 1e-7
+_STORY_FILTERS = [
+    ScalableBloomFilter(initial_capacity=10_000, error_rate=STORY_FILTER_ERROR_RATE)
+    for _ in range(STORY_BANDS)
+]
+_STORY_LOCK = threading.Lock()
+
+def story_bands(article_text):
+    """
+    Computes the LSH band keys of an article's MinHash signature.
+
+    CPU-bound; call it from a worker thread.
+
+    Returns:
+        The band keys, or an empty list if the text is too short to compare.
+    """
+    words = article_text.lower().split()
+    starts = range(max(1, len(words) - STORY_SHINGLE_WORDS + 1))
+    shingles = {" ".join(words[i:i + STORY_SHINGLE_WORDS]) for i in starts}
+    if len(shingles) < MIN_STORY_SHINGLES:
+        return []
+    minhash = MinHash(num_perm=STORY_BANDS * STORY_ROWS)
+    minhash.update_batch([shingle.encode() for shingle in shingles])
+    values = minhash.hashvalues
+    keys = []
+    for band in range(STORY_BANDS):
+        rows = values[band * STORY_ROWS:(band + 1) * STORY_ROWS].tobytes()
+        keys.append(f"{band}:" + hashlib.blake2b(rows, digest_size=8).hexdigest())
+    return keys
+
+def story_source(article_url):
+    """Returns the outlet an article belongs to, for near-duplicate checks."""
+    return urlsplit(article_url).netloc.lower()
+
+def is_near_duplicate(bands, source):
+    """
+    Returns True if any band matches a story already posted from another outlet.
+
+    A band this outlet has posted itself is ignored, even if another outlet
+    posted it too.
+    """
+    with _STORY_LOCK:
+        return any(
+            key in band_filter and f"{source}|{key}" not in band_filter
+            for key, band_filter in zip(bands, _STORY_FILTERS)
+        )
+
+def remember_story(bands, source):
+    """Records a posted story's band keys so later copies are recognised."""
+    with _STORY_LOCK:
+        for key, band_filter in zip(bands, _STORY_FILTERS):
+            band_filter.add(key)
+            band_filter.add(f"{source}|{key}")
+
+# --- 4. SCRAPE -> SUMMARIZE -> POST PIPELINE ---
+# Marks the end of a stage's output on its queue.
+_DONE = object()
+
+# How long the summarizer waits for more scraped articles to fill a batch.
+BATCH_LINGER_SECONDS = 0.5
+
+# How often posted URLs are written to the store during a run, bounding what a
+# killed process can forget (and then post again).
+POSTED_FLUSH_SECONDS = 5
+
+async def _as_async_iter(items):
+    """Iterates a plain or async iterable from a coroutine."""
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+async def _cancel_and_wait(tasks):
+    """Cancels a stage's child tasks and waits until every one of them has finished."""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+async def run_pipeline(client, articles, groq_api_key, bot_token, channel_id, log=print, batch_size=5):
+    """
+    Scrapes, summarizes and posts articles as three overlapping stages.
+
+    The stages are connected by bounded queues, so Groq summarizes early articles
+    while later ones are still downloading and Telegram posts while Groq works.
+
+    Args:
+        client: The agent's shared httpx.AsyncClient, used for downloads and Telegram posts.
+        articles: New (not yet posted) article dicts with 'title' and 'url'. May be
+            an async iterable, in which case scraping starts as each article arrives.
+        log: Callback that receives human-readable progress messages.
+
+    Returns:
+        The number of articles successfully posted.
+    """
+    scraped = asyncio.Queue(maxsize=8)
+    summarized = asyncio.Queue(maxsize=8)
+    # URLs to record as posted, written in one transaction every few seconds
+    to_mark = []
+
+    def flush_marks():
+        if to_mark:
+            urls = to_mark[:]
+            to_mark.clear()
+            mark_many_as_posted(urls)
+
+    async def flusher():
+        while True:
+            await asyncio.sleep(POSTED_FLUSH_SECONDS)
+            flush_marks()
+
+    async def scraper():
+        semaphore = asyncio.Semaphore(5)
+        # Band key -> outlet of the article in this run that claimed it
+        in_flight = {}
+
+        async def scrape_one(article):
+            # Only the download holds a slot; parsing runs in its own worker thread.
+            async with semaphore:
+                html = await _fetch_article(client, article['url'])
+            content = await asyncio.to_thread(_parse_article, html) if html else None
+            if not content:
+                log(f"⚠️ Could not scrape content for article. Skipping.")
+                return
+            article['text'] = content['text']
+            article['image_url'] = content['image_url']
+
+            # Skip stories already posted from another outlet, and copies of a
+            # story that another article in this run is already handling.
+            article['bands'] = await asyncio.to_thread(story_bands, article['text'])
+            article['source'] = story_source(article['url'])
+            if is_near_duplicate(article['bands'], article['source']):
+                to_mark.append(article['url'])
+                log(f"♻️ Skipping near-duplicate of a posted story: '{article['title'][:50]}...'")
+                return
+            if any(in_flight.get(key, article['source']) != article['source'] for key in article['bands']):
+                log(f"♻️ Skipping copy of a story already being posted: '{article['title'][:50]}...'")
+                return
+            for key in article['bands']:
+                in_flight.setdefault(key, article['source'])
+            await scraped.put(article)
+
+        tasks = []
+        try:
+            async for article in _as_async_iter(articles):
+                tasks.append(asyncio.create_task(scrape_one(article)))
+            await asyncio.gather(*tasks)
+        finally:
+            # A scrape left behind would block forever on the queue once the summarizer is gone
+            await _cancel_and_wait(tasks)
+        await scraped.put(_DONE)
+
+    async def summarizer():
+        loop = asyncio.get_running_loop()
+        # Shared by every batch in this run, so batches overlap up to LLM_CONCURRENCY requests
+        llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+
+        async def summarize_batch(batch):
+            # Reuse the summary of identical text (e.g. syndicated wire stories)
+            to_summarize = []
+            for article in batch:
+                article['summary'] = get_cached_summary(article['text'])
+                if not article['summary']:
+                    to_summarize.append(article)
+
+            if to_summarize:
+                summaries = await summarize_articles(groq_api_key, to_summarize, llm_semaphore, batch_size)
+                for article, summary in zip(to_summarize, summaries):
+                    article['summary'] = summary
+                    if summary:
+                        cache_summary(article['text'], summary)
+
+            for article in batch:
+                if not article['summary']:
+                    log(f"⚠️ Summarization failed. Skipping.")
+                    continue
+                await summarized.put(article)
+
+        # Each batch is summarized in its own task, so the next batch is being
+        # collected while earlier ones wait on Groq.
+        tasks = []
+        done = False
+        try:
+            while not done:
+                # Collect up to a full batch, waiting briefly for stragglers so the
+                # articles of a site that just arrived share one Groq request.
+                batch = [await scraped.get()]
+                deadline = loop.time() + BATCH_LINGER_SECONDS
+                while len(batch) < batch_size and batch[-1] is not _DONE:
+                    if not scraped.empty():
+                        batch.append(scraped.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(scraped.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                if batch[-1] is _DONE:
+                    batch.pop()
+                    done = True
+                if batch:
+                    tasks.append(asyncio.create_task(summarize_batch(batch)))
+            await asyncio.gather(*tasks)
+        finally:
+            # Don't leave batches calling Groq after the pipeline has been torn down
+            await _cancel_and_wait(tasks)
+        await summarized.put(_DONE)
+
+    async def poster():
+        semaphore = asyncio.Semaphore(3)
+        posted = 0
+        stopping = False
+
+        async def post_one(article):
+            nonlocal posted
+            async with semaphore:
+                if stopping:
+                    return
+                success = await post_to_telegram(client, bot_token, channel_id, article['summary'], article)
+            if success:
+                to_mark.append(article['url'])
+                remember_story(article['bands'], article['source'])
+                posted += 1
+                log(f"✅ Successfully posted '{article['title'][:50]}...'!")
+            else:
+                log(f"❌ Failed to post article.")
+
+        tasks = []
+        try:
+            while (article := await summarized.get()) is not _DONE:
+                tasks.append(asyncio.create_task(post_one(article)))
+            await asyncio.gather(*tasks)
+        finally:
+            # Posts already sent to Telegram are left to finish (bounded by the
+            # client's timeout) so they get recorded; queued ones are dropped.
+            # Cancelling one mid-request could deliver it without recording it.
+            stopping = True
+            await asyncio.gather(*tasks, return_exceptions=True)
+        return posted
+
+    stages = [asyncio.create_task(stage()) for stage in (scraper, summarizer, poster)]
+    flush_task = asyncio.create_task(flusher())
+    try:
+        await asyncio.gather(*stages)
+    finally:
+        # If one stage fails, don't leave the others blocked on their queues.
+        # Each stage cancels its own child tasks on the way out.
+        await _cancel_and_wait(stages)
+        flush_task.cancel()
+        # Also on failure or cancellation. Every stage has waited for its
+        # children by now, so no post can still be adding to to_mark.
+        flush_marks()
+    return stages[2].result()
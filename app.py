@@ -1,25 +1,33 @@
 # app.py
 import streamlit as st
+from streamlit_autorefresh import st_autorefresh
 import os
 from dotenv import load_dotenv
 import asyncio
+import threading
 import time
 from datetime import datetime
+from collections import deque
+
+# uvloop isn't available on Windows; the agent falls back to the default loop
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Import the core logic functions
 from agent_logic import (
+    create_http_client,
+    compile_selector,
     get_latest_articles,
-    scrape_article_content,
-    summarize_article,
-    post_to_telegram,
-    has_been_posted,
-    mark_as_posted
+    filter_unposted,
+    run_pipeline
 )
 
 load_dotenv()
 
 # --- 1. NEWS SOURCE CONFIGURATION ---
-NEWS_SITES = {
+NEWS_SITES_RAW = {
     # ... (The list of 30 news sites remains unchanged) ...
     # North America
     "AP News": {"url": "https://apnews.com", "selector": ".CardHeadline > a"},
@@ -68,130 +76,251 @@ NEWS_SITES = {
     "The Economist": {"url": "https://www.economist.com/", "selector": "a[data-analytics='hero-click']"},
 }
 
+@st.cache_resource
+def load_sites():
+    """
+    Builds the site table, with each site's compiled CSS selector, once per process.
+
+    Streamlit re-executes this script on every rerun; the cached table is shared
+    by every run and by the agent's thread.
+    """
+    return {
+        name: {**cfg, 'compiled': compile_selector(cfg['selector'])}
+        for name, cfg in NEWS_SITES_RAW.items()
+    }
+
+NEWS_SITES = load_sites()
+
 # --- 2. STREAMLIT UI SETUP ---
 st.set_page_config(page_title="Autonomous News Agent", layout="wide")
 st.title("📰 Autonomous News Agent")
 st.markdown("This agent autonomously scrapes news from global sources, summarizes new articles, and posts them to a Telegram channel.")
 
-# Initialize session state for agent control
-if 'running' not in st.session_state:
-    st.session_state.running = False
-if 'site_index' not in st.session_state:
-    st.session_state.site_index = 0
-if 'log_messages' not in st.session_state:
-    st.session_state.log_messages = []
+# --- 3. BACKGROUND AGENT ---
+# The agent runs as one long-lived task on a background event loop. Streamlit
+# only starts/stops it and repaints its log, so reruns never do agent work.
+
+@st.cache_resource
+def get_agent_loop():
+    """
+    Starts the process-wide event loop the agent's coroutines run on.
+
+    It runs forever in a daemon thread, so the shared HTTP client keeps its
+    connections across cycles instead of losing them with each loop. Uses uvloop
+    when it's installed; Streamlit's own loop is left alone.
+    """
+    loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
+    return loop
+
+@st.cache_resource
+def get_http_client():
+    """Returns the pooled HTTP client shared by every cycle on the agent loop."""
+    return create_http_client()
+
+@st.cache_resource
+def get_agent():
+    """
+    Returns the process-wide agent state shared by the UI and the agent task.
+
+    Plain containers rather than st.session_state, which isn't reachable from
+    the agent's thread.
+    """
+    return {
+        'running': False,
+        'task': None,              # concurrent.futures.Future of run_agent_forever
+        'wake': None,              # asyncio.Event that cuts the task's wait between cycles short
+        # Changed only from the multiselect's on_change, so a new session can't reset it
+        'selected_sites': list(NEWS_SITES.keys())[:10],
+        # Newest first; the deque drops the oldest entry past 50
+        'log_messages': deque(maxlen=50),
+        # Per-site polling schedule: when each site is next due and its current interval
+        'next_due': {},
+        'poll_interval': {},
+    }
+
+http_client = get_http_client()
+agent = get_agent()
 
 def add_log(message):
     """Adds a timestamped message to the log."""
     now = datetime.now().strftime("%H:%M:%S")
-    st.session_state.log_messages.insert(0, f"[{now}] {message}")
-    # Keep the log from growing too large
-    if len(st.session_state.log_messages) > 50:
-        st.session_state.log_messages.pop()
+    agent['log_messages'].appendleft(f"[{now}] {message}")
+
+# Quiet sites are polled less and less often, up to MAX_POLL_INTERVAL seconds;
+# a site that publishes something new drops back to BASE_POLL_INTERVAL.
+BASE_POLL_INTERVAL = 60
+MAX_POLL_INTERVAL = 900
+
+# Homepages fetched at the same time
+HOMEPAGE_CONCURRENCY = 8
+
+def schedule_next_poll(site_name, found_new):
+    """Sets when site_name is next due, backing off while it has nothing new."""
+    interval = agent['poll_interval'].get(site_name, BASE_POLL_INTERVAL)
+    interval = BASE_POLL_INTERVAL if found_new else min(interval * 1.5, MAX_POLL_INTERVAL)
+    agent['poll_interval'][site_name] = interval
+    agent['next_due'][site_name] = time.time() + interval
+
+async def process_site(site_name, semaphore):
+    """Fetches one site's homepage and returns the articles that haven't been posted yet."""
+    config = NEWS_SITES[site_name]
+    try:
+        async with semaphore:
+            latest_articles = await get_latest_articles(
+                http_client, config['url'], config['compiled']
+            )
+
+        if not latest_articles:
+            add_log(f"No articles found or site error for {site_name}.")
+            schedule_next_poll(site_name, found_new=False)
+            return []
+
+        # Skip already-posted articles silently to keep log clean
+        unposted = filter_unposted([a['url'] for a in latest_articles])
+        new_articles = [a for a in latest_articles if a['url'] in unposted]
+    except Exception as e:
+        # Every site feeds one pipeline, so one site's failure must not end the cycle
+        add_log(f"❌ Error checking {site_name}: {e}")
+        schedule_next_poll(site_name, found_new=False)
+        return []
+
+    schedule_next_poll(site_name, found_new=bool(new_articles))
+    if not new_articles:
+        add_log(f"No new articles to post from {site_name}.")
+    for article in new_articles:
+        add_log(f"New article found: '{article['title'][:50]}...'")
+    return new_articles
+
+async def new_articles_as_found(sites):
+    """Yields new articles from every site, each site's as soon as its homepage arrives."""
+    # Bound the homepage fan-out so a full selection doesn't open every connection at once
+    semaphore = asyncio.Semaphore(HOMEPAGE_CONCURRENCY)
+    for site_done in asyncio.as_completed([process_site(s, semaphore) for s in sites]):
+        for article in await site_done:
+            yield article
+
+async def run_cycle(sites):
+    """Checks every due site once, then scrapes, summarizes and posts the new articles."""
+    now = time.time()
+    due_sites = [s for s in sites if agent['next_due'].get(s, 0) <= now]
+    if not due_sites:
+        return
+
+    add_log(f"--- Checking {len(due_sites)} sites ---")
+
+    # --- Sites are processed concurrently and feed one overlapping pipeline, so a
+    # fast site's articles are being scraped while slow homepages still load ---
+    await run_pipeline(
+        http_client, new_articles_as_found(due_sites),
+        GROQ_API_KEY, TELEGRAM_BOT_TOKEN, TELEGRAM_CHANNEL_ID, log=add_log
+    )
+
+async def run_agent_forever():
+    """
+    Runs cycles until the agent is stopped, sleeping until the next site is due.
+
+    The sleep is a single wait on agent['wake'] that times out when the next
+    site is due, so Stop takes effect at once instead of at the next tick.
+    """
+    wake = agent['wake'] = asyncio.Event()
+    add_log("Agent started.")
+    while agent['running']:
+        # Cleared before the cycle, so a wake during it (a new selection) isn't lost
+        wake.clear()
+        sites = list(agent['selected_sites'])
+        try:
+            await run_cycle(sites)
+        except Exception as e:
+            add_log(f"❌ Cycle failed: {e}")
 
-# --- Sidebar Controls ---
+        # Wait at least a second so a failed cycle can't spin the CPU
+        wake_at = max(time.time() + 1, min((agent['next_due'].get(s, 0) for s in sites), default=0))
+        if agent['running']:
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=wake_at - time.time())
+            except asyncio.TimeoutError:
+                pass
+    add_log("Agent stopped.")
+
+def wake_agent():
+    """Interrupts the agent's wait between cycles, from the Streamlit thread."""
+    if agent['wake'] is not None:
+        get_agent_loop().call_soon_threadsafe(agent['wake'].set)
+
+# Get API keys once
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_CHANNEL_ID = os.getenv("TELEGRAM_CHANNEL_ID")
+
+# --- 4. AGENT CONTROLS ---
 st.sidebar.header("Agent Controls")
 
+keys_missing = not all([GROQ_API_KEY, TELEGRAM_BOT_TOKEN, TELEGRAM_CHANNEL_ID])
+
 if st.sidebar.button("🚀 Start Agent", use_container_width=True):
-    if not st.session_state.running:
-        st.session_state.running = True
-        st.session_state.site_index = 0
-        add_log("Agent started.")
+    # Checked before the task is submitted, so a misconfigured agent never runs a cycle
+    if keys_missing:
+        pass  # The error below explains why
+    elif not agent['selected_sites']:
+        st.warning("No media sources selected. Please select at least one source.")
+    elif not agent['running']:
+        agent['running'] = True
+        # A previous task may still be finishing its last cycle; it simply carries on
+        if agent['task'] is None or agent['task'].done():
+            agent['task'] = asyncio.run_coroutine_threadsafe(run_agent_forever(), get_agent_loop())
 
 if st.sidebar.button("🛑 Stop Agent", use_container_width=True):
-    if st.session_state.running:
-        st.session_state.running = False
+    if agent['running']:
+        agent['running'] = False
         add_log("Agent stopping...")
+        wake_agent()
 
-# Status indicator
-if st.session_state.running:
-    st.sidebar.success(f"Agent is running... (Processing site {st.session_state.site_index + 1})")
-else:
-    st.sidebar.info("Agent is stopped.")
+# Filled in below, once the key and source checks have run
+status_box = st.sidebar.container()
+
+def on_sites_changed():
+    """Applies this session's site selection to the shared agent."""
+    agent['selected_sites'] = list(st.session_state['selected_sites'])
+    # Newly added sites are checked now rather than when the current wait ends
+    wake_agent()
 
 st.sidebar.header("Media Configuration")
+# Seeded from the agent, so every tab shows (and only edits) the sites it actually runs on
 selected_sites = st.sidebar.multiselect(
     "Select or Exclude News Websites",
     options=list(NEWS_SITES.keys()),
-    default=list(NEWS_SITES.keys())[:10]
+    default=agent['selected_sites'],
+    key="selected_sites",
+    on_change=on_sites_changed
 )
 
-# --- 3. MAIN AGENT LOOP ---
-
-# Get API keys once
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-TELEGRAM_CHANNEL_ID = os.getenv("TELEGRAM_CHANNEL_ID")
-
-# Check for API keys before starting
-if not all([GROQ_API_KEY, TELEGRAM_BOT_TOKEN, TELEGRAM_CHANNEL_ID]):
+if keys_missing:
     st.error("🚨 Missing API keys in your .env file! The agent cannot run.")
-    st.session_state.running = False
-
-if st.session_state.running:
-    if not selected_sites:
-        st.warning("No media sources selected. Please select at least one source.")
-        st.session_state.running = False
-    else:
-        # Determine which site to process in this cycle
-        # This ensures that even if the user changes the selection, we don't get an error
-        current_index = st.session_state.site_index % len(selected_sites)
-        site_name = selected_sites[current_index]
-        config = NEWS_SITES[site_name]
 
-        add_log(f"--- Checking {site_name} ---")
+# Every source was deselected while the agent was running
+if agent['running'] and not selected_sites:
+    st.warning("No media sources selected. Please select at least one source.")
+    agent['running'] = False
+    wake_agent()
 
-        # --- Run the core logic for one site ---
-        latest_articles = get_latest_articles(config['url'], config['selector'])
+# Status indicator
+if agent['running']:
+    status_box.success("Agent is running...")
+    next_due = dict(agent['next_due'])
+    due_times = [next_due[s] for s in selected_sites if s in next_due]
+    if due_times:
+        status_box.caption(f"Next check in {max(0, int(min(due_times) - time.time()))}s")
+    # Repaint the log every two seconds; the agent itself never waits on a rerun
+    st_autorefresh(interval=2000, key="log_refresh")
+else:
+    status_box.info("Agent is stopped.")
 
-        if not latest_articles:
-            add_log(f"No articles found or site error for {site_name}.")
-        else:
-            new_articles_found = 0
-            for article in latest_articles:
-                if has_been_posted(article['url']):
-                    continue # Skip silently to keep log clean
-
-                new_articles_found += 1
-                add_log(f"New article found: '{article['title'][:50]}...'")
-                
-                content = scrape_article_content(article['url'])
-                if not content or not content['text']:
-                    add_log(f"⚠️ Could not scrape content for article. Skipping.")
-                    continue
-                
-                article['image_url'] = content['image_url']
-                summary = summarize_article(GROQ_API_KEY, content['text'], article['title'])
-                
-                if not summary:
-                    add_log(f"⚠️ Summarization failed. Skipping.")
-                    continue
-                
-                success = asyncio.run(post_to_telegram(
-                    TELEGRAM_BOT_TOKEN, TELEGRAM_CHANNEL_ID, summary, article
-                ))
-
-                if success:
-                    mark_as_posted(article['url'])
-                    add_log(f"✅ Successfully posted '{article['title'][:50]}...'!")
-                else:
-                    add_log(f"❌ Failed to post article.")
-            
-            if new_articles_found == 0:
-                add_log(f"No new articles to post from {site_name}.")
-
-        # --- Move to the next site for the next cycle ---
-        st.session_state.site_index += 1
-        
-        # Use Streamlit's rerun feature to create an immediate, continuous loop
-        time.sleep(1) # A tiny sleep to prevent maxing out the CPU
-        st.rerun()
-
-# --- 4. DISPLAY LOGS ---
+# --- 5. DISPLAY LOGS ---
 st.header("Activity Log")
 log_container = st.container(height=500)
 with log_container:
-    for msg in st.session_state.log_messages:
+    for msg in list(agent['log_messages']):
         if "✅" in msg:
             st.success(msg)
         elif "⚠️" in msg or "❌" in msg: